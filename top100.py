@@ -1,79 +1,374 @@
 import os
 import json
+import atexit
+import logging
+import logging.handlers
+import queue
+import functools
+import hashlib
+import shelve
 import re
 import shutil
+import threading
 import argparse
 import random
-import openai  # Das OpenAI-Modul für API-Calls importieren
-import time  # Importiere das time-Modul
+import asyncio
+import time
+import httpx
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from openai import AsyncOpenAI, APIError, APIStatusError, RateLimitError  # Asynchroner OpenAI-Client für parallele API-Calls
 from dotenv import load_dotenv  # Import the dotenv package
 
+try:
+    import ijson  # Streaming JSON parser for reading the keys of large trivia files
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # Faster JSON parsing and serialization
+except ImportError:
+    orjson = None
+
+try:
+    import tiktoken  # Exact token counts for the request budget
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables from the .env file
 load_dotenv()
 
-# Retrieve API keys and secrets from environment variables
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Maximum number of concurrent OpenAI requests, requests per minute and tokens per minute
+# (depends on the account tier)
+OAI_CONCURRENCY = int(os.getenv("OAI_CONCURRENCY", "20"))
+OAI_RPM_LIMIT = int(os.getenv("OAI_RPM_LIMIT", "500"))
+OAI_TPM_LIMIT = int(os.getenv("OAI_TPM_LIMIT", "200000"))
+# Seconds in which no new requests are started after OpenAI reported a rate limit error
+RATE_LIMIT_COOLDOWN = 15
+# Client errors that fail again on every attempt, such as an invalid request or API key.
+# Other errors, e.g. 408 (timeout), 409 (conflict), 429 and 5xx, are retried.
+NON_RETRYABLE_STATUS_CODES = (400, 401, 403, 404, 422)
+
+# Retrieve API keys and secrets from environment variables.
+# One client for all requests, so the connections to the API are kept alive and reused.
+# Retries are handled in request_album_trivia, so the client itself does not retry.
+client = AsyncOpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=OAI_CONCURRENCY, max_keepalive_connections=OAI_CONCURRENCY),
+        # Generating 9 questions can take a while, connecting should not
+        timeout=httpx.Timeout(120.0, connect=5.0)
+    ),
+    max_retries=0
+)
+
+# Model used for all trivia requests, its context window and the output tokens requested
+# for 9 questions. A question needs up to about 60 tokens, its 4 options 120 and the trivia
+# 160, plus the JSON syntax. Responses cut off at the limit are retried with twice the budget.
+OPENAI_MODEL = "gpt-4o-mini"
+MODEL_CONTEXT_TOKENS = 128000
+MAX_TOKENS_PER_QUESTION = 350
+MAX_OUTPUT_TOKENS = 9 * MAX_TOKENS_PER_QUESTION
+SYSTEM_PROMPT = ("You are a helpful trivia question generator. "
+                 "You must respond with a single valid JSON object.")
+
+# Structure of the response, enforced by the API through structured outputs
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}},
+        "correctAnswer": {"type": "string"},
+        "trivia": {"type": "string"}
+    },
+    "required": ["question", "options", "correctAnswer", "trivia"],
+    "additionalProperties": False
+}
+TRIVIA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        difficulty: {"type": "array", "items": QUESTION_SCHEMA} for difficulty in ("easy", "medium", "hard")
+    },
+    "required": ["easy", "medium", "hard"],
+    "additionalProperties": False
+}
+
+# Generated questions are cached on disk, so an interrupted run does not request them again.
+# Increase PROMPT_VERSION whenever the prompt changes to invalidate the cached questions.
+RESPONSE_CACHE_FILE = os.getenv("TRIVIA_CACHE_FILE", ".trivia_cache")
+# The cache is read and written in worker threads; shelve does not support concurrent access
+RESPONSE_CACHE_LOCK = threading.Lock()
+PROMPT_VERSION = 2
+
+# Number of finished albums after which the JSON file is written as a checkpoint
+CHECKPOINT_INTERVAL = 10
+
+# Pattern used for every input file, compiled once
+GENRE_AFFIX_PATTERN = re.compile(r'^top100_|_albums$')
+
+# Limits the number of OpenAI requests in flight at the same time
+api_semaphore = asyncio.Semaphore(OAI_CONCURRENCY)
+
+def setup_logging(verbose=False):
+    """
+    Configures logging through a queue: the log records are written to stderr by a
+    background thread, so logging never blocks the event loop. The thread is stopped
+    and the remaining records are written when the interpreter exits.
+
+    The level is taken from the LOG_LEVEL environment variable (default INFO, also used
+    for unknown level names).
+
+    :param verbose: Whether to log debug messages, including the raw OpenAI responses.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    # Other libraries (e.g. httpx, which logs every request) only log warnings
+    root_logger = logging.getLogger()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.WARNING)
+    level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+    level = logging.getLevelName(level_name)  # The level number, or a string for unknown names
+    valid_level = isinstance(level, int)
+    logger.setLevel(logging.DEBUG if verbose else level if valid_level else logging.INFO)
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    if not valid_level:
+        logger.warning(f"Unknown LOG_LEVEL '{level_name}', using INFO.")
+
+class FilenameCharMap(dict):
+    """
+    Translation table for str.translate that maps every character except ASCII letters
+    and digits to an underscore. Characters are added on first use, so the table also
+    covers non-ASCII characters without listing all of Unicode up front.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        replacement = char if char.isascii() and char.isalnum() else '_'
+        self[codepoint] = replacement
+        return replacement
+
+FILENAME_CHAR_MAP = FilenameCharMap()
+
+@dataclass
+class StatusTracker:
+    """
+    Keeps track of the OpenAI requests of a run and of the requests and tokens of the last minute.
+
+    When a request is admitted, its estimated tokens are reserved in the one-minute window,
+    so requests still in flight count against the tokens-per-minute limit. The reservation
+    is replaced by the tokens from the `usage` field of the response when it arrives; failed
+    requests keep their estimate. Together with the start times of the requests this delays
+    new requests before they would exceed the requests-per-minute or tokens-per-minute limit.
+    """
+    rpm_limit: int
+    tpm_limit: int
+    num_tasks_started: int = 0
+    num_tasks_succeeded: int = 0
+    num_tasks_failed: int = 0
+    num_rate_limit_errors: int = 0
+    num_api_errors: int = 0
+    num_other_errors: int = 0
+    token_usage: deque = field(default_factory=deque)  # [timestamp, tokens] of recently admitted requests
+    total_response_tokens: int = 0
+    num_responses: int = 0
+    request_times: deque = field(default_factory=deque)  # timestamps of recently started requests
+    time_of_last_rate_limit_error: float = 0.0
+
+    def record_rate_limit_error(self):
+        """
+        Records a rate limit error, which pauses new requests for RATE_LIMIT_COOLDOWN seconds.
+        """
+        self.num_rate_limit_errors += 1
+        self.time_of_last_rate_limit_error = time.monotonic()
+
+    def record_usage(self, reservation, tokens):
+        """
+        Replaces the estimated tokens reserved for a request with the tokens it actually used.
+
+        :param reservation: The reservation returned by wait_for_capacity.
+        :param tokens: The total tokens from the `usage` field of the response.
+        """
+        reservation[1] = tokens
+        self.total_response_tokens += tokens
+        self.num_responses += 1
+
+    def requests_last_minute(self):
+        """
+        Returns the number of requests started within the last 60 seconds.
+        """
+        cutoff = time.monotonic() - 60
+        while self.request_times and self.request_times[0] < cutoff:
+            self.request_times.popleft()
+        return len(self.request_times)
+
+    def tokens_last_minute(self):
+        """
+        Returns the number of tokens used or reserved within the last 60 seconds.
+        """
+        cutoff = time.monotonic() - 60
+        while self.token_usage and self.token_usage[0][0] < cutoff:
+            self.token_usage.popleft()
+        return sum(tokens for _, tokens in self.token_usage)
+
+    def expected_tokens(self, default):
+        """
+        Estimates the tokens of the next request from the average of the previous responses.
+        """
+        if not self.num_responses:
+            return default
+        return self.total_response_tokens // self.num_responses
+
+    async def wait_for_capacity(self, default_tokens):
+        """
+        Waits until the next request fits into the requests-per-minute and tokens-per-minute
+        limits and the pause after a rate limit error is over, then records its start and
+        reserves its estimated tokens.
+
+        :param default_tokens: The estimate used until the first responses have arrived.
+        :return: The reservation, to be passed to record_usage when the response arrives.
+        """
+        # A single request larger than the limit is admitted once the window is empty
+        tokens = min(self.expected_tokens(default_tokens), self.tpm_limit)
+        while True:
+            cooldown = self.time_of_last_rate_limit_error + RATE_LIMIT_COOLDOWN - time.monotonic()
+            if cooldown > 0:
+                await asyncio.sleep(cooldown)
+            elif self.requests_last_minute() >= self.rpm_limit:
+                # Wait until the oldest request drops out of the one-minute window
+                await asyncio.sleep(max(self.request_times[0] + 60 - time.monotonic(), 0.1))
+            elif self.tokens_last_minute() + tokens > self.tpm_limit:
+                # Wait until the oldest admitted request drops out of the one-minute window
+                await asyncio.sleep(max(self.token_usage[0][0] + 60 - time.monotonic(), 0.1))
+            else:
+                break
+        now = time.monotonic()
+        self.request_times.append(now)
+        reservation = [now, tokens]
+        self.token_usage.append(reservation)
+        return reservation
+
+status_tracker = StatusTracker(rpm_limit=OAI_RPM_LIMIT, tpm_limit=OAI_TPM_LIMIT)
 
 def read_album_data(file_path):
     """
-    Reads a file containing a list of albums and stores the data in a list of dictionaries.
-    Each dictionary contains the artist, album, and year of the album.
+    Reads a file containing a list of albums line by line.
+    Each album is yielded as a dictionary with the artist, album, and year of the album.
 
     Args:
         file_path (str): The path to the file containing album data.
 
-    Returns:
-        list: A list of dictionaries, where each dictionary contains 'artist', 'album', and 'year'.
+    Yields:
+        dict: A dictionary with the keys 'artist', 'album', and 'year'.
     """
-    album_data = []
-    with open(file_path, 'r') as file:
-        lines = file.readlines()  # Read all lines from the file
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()  # Remove leading and trailing whitespace
+            if not line:
+                continue
 
-    for line in lines:
-        line = line.strip()  # Remove leading and trailing whitespace
-        try:
-            # Split the line from the last occurrence of ' - ' to separate year from artist/album
-            artist_album, year = line.rsplit(' - ', 1)
-            # Split the remaining part into artist and album
-            artist, album = artist_album.split(' - ', 1)
-            # Append the extracted data as a dictionary to the album_data list
-            album_data.append({
+            # "Artist - Album - Year": the year starts after the last ' - ',
+            # the artist ends at the first one
+            artist_album, separator, year = line.rpartition(' - ')
+            if separator:
+                artist, separator, album = artist_album.partition(' - ')
+            if not separator:
+                # Print a message if the line format is unexpected
+                logger.warning(f"Zeile übersprungen (unerwartetes Format): {line}")
+                continue
+
+            yield {
                 "artist": artist,
                 "album": album,
                 "year": year
-            })
-        except ValueError:
-            # Print a message if the line format is unexpected
-            print(f"Zeile übersprungen (unerwartetes Format): {line}")
+            }
+
+# Decoder for finding a JSON object inside additional text
+JSON_DECODER = json.JSONDecoder()
+
+def parse_json(content):
+    """
+    Parses a JSON document with orjson if it is installed, otherwise with the json module.
 
-    return album_data
+    Args:
+        content (str | bytes): The JSON document.
+
+    Returns:
+        The parsed JSON value.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON (orjson's error is a subclass).
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
 
 def extract_json_from_response(raw_content):
     """
-    Extracts the JSON part from the response, even if additional text is present.
+    Parses the JSON object of the response.
+
+    The requests use structured outputs (json_schema), so the content is normally a single
+    JSON document. If the model wrapped the JSON in additional text anyway, the first
+    object that can be decoded starting at a '{' is used.
 
     Args:
         raw_content (str): The raw content of the response.
 
     Returns:
-        dict or None: The extracted JSON object or None if no valid JSON is found.
+        dict: The parsed JSON object.
+
+    Raises:
+        ValueError: If no valid JSON is found, e.g. because the response was truncated.
     """
-    # Look for a JSON object in the response content
-    json_pattern = r'\{.*\}'  # Matches any JSON object
-    matches = re.findall(json_pattern, raw_content, re.DOTALL)
+    try:
+        return parse_json(raw_content)
+    except json.JSONDecodeError as e:
+        error = e
 
-    if matches:
-        # Iterate over each match and try to parse it as JSON
-        for match in matches:
-            try:
-                return json.loads(match)
-            except json.JSONDecodeError as e:
-                # If the JSON is not valid, print the error
-                print(f"Error loading JSON: {e}, content: {match}")
-                continue
+    # Fallback for responses with text around the JSON object: raw_decode parses from the
+    # given position and ignores everything after the object, so no slicing is needed
+    start = raw_content.find('{')
+    while start != -1:
+        try:
+            trivia_json, _ = JSON_DECODER.raw_decode(raw_content, start)
+            return trivia_json
+        except json.JSONDecodeError:
+            start = raw_content.find('{', start + 1)
+
+    raise ValueError(f"No valid JSON format found: {error}")
+
+def validate_trivia_questions(trivia_json):
+    """
+    Checks that the generated trivia contains 3 complete questions for every difficulty level,
+    each with exactly 4 answer options that include the correct answer.
+
+    :param trivia_json: The parsed JSON response of the model.
+    :return: True if the structure is valid, False otherwise.
+    """
+    if not isinstance(trivia_json, dict):
+        return False
 
-    # If no valid JSON is found, raise a ValueError
-    raise ValueError("No valid JSON format found.")
+    for difficulty in ("easy", "medium", "hard"):
+        entries = trivia_json.get(difficulty)
+        if not isinstance(entries, list) or len(entries) != 3:
+            return False
+        for entry in entries:
+            if not isinstance(entry, dict) or not all(
+                key in entry for key in ("question", "options", "correctAnswer", "trivia")
+            ):
+                return False
+            options = entry["options"]
+            if not isinstance(options, list) or len(options) != 4 or entry["correctAnswer"] not in options:
+                return False
+
+    return True
 
 def clean_filename(text):
     """
@@ -88,16 +383,330 @@ def clean_filename(text):
     :return: The cleaned string
     """
     # Replace all special characters with underscores
-    cleaned_text = re.sub(r'[^A-Za-z0-9]', '_', text)
+    cleaned_text = text.translate(FILENAME_CHAR_MAP)
     # Convert the string to lower case
     cleaned_text = cleaned_text.lower()
     return cleaned_text
 
-def generate_trivia_for_album(album, artist, year, retries=3):
+@functools.lru_cache(maxsize=None)
+def get_token_encoding():
     """
-    Generates trivia questions for an album with the given artist, album title, and year.
+    Returns the tiktoken encoding of the model, or None if tiktoken cannot be used.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except Exception as e:
+        # tiktoken downloads the encoding on first use, which can fail without network access
+        logger.warning(f"tiktoken encoding for {OPENAI_MODEL} not available, estimating tokens instead: {e}")
+        return None
+
+def count_prompt_tokens(prompt):
+    """
+    Counts the input tokens of a request with the given prompt.
+
+    Uses tiktoken if it is installed, otherwise estimates about 4 characters per token.
+    A few tokens are added for the message formatting of the chat request.
+
+    :param prompt: The prompt describing the questions to generate.
+    :return: The number of input tokens.
+    """
+    text = SYSTEM_PROMPT + prompt
+    encoding = get_token_encoding()
+    if encoding is not None:
+        tokens = len(encoding.encode(text))
+    else:
+        tokens = len(text) // 4 + 1
+    return tokens + 10
+
+def build_chat_request(prompt, prompt_tokens=None, output_tokens=MAX_OUTPUT_TOKENS):
+    """
+    Builds the parameters of the chat completion request for the given prompt.
+
+    The same parameters are used for regular requests and as the body of Batch API requests.
+    max_tokens is limited to what fits into the context window next to the prompt, so the
+    request is not rejected.
+
+    :param prompt: The prompt describing the questions to generate.
+    :param prompt_tokens: The input tokens of the prompt, if they are already counted.
+    :param output_tokens: The output token budget, raised when a previous response was cut off.
+    :return: A dictionary with the request parameters.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = count_prompt_tokens(prompt)
+
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": min(output_tokens, MODEL_CONTEXT_TOKENS - prompt_tokens),
+        "temperature": 0.7,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "album_trivia", "strict": True, "schema": TRIVIA_SCHEMA}
+        }
+    }
+
+def parse_trivia_response(raw_content, album, artist):
+    """
+    Parses and validates the model response with all trivia questions of an album.
+
+    :param raw_content: The message content returned by the model.
+    :param album: The title of the album, used for log messages.
+    :param artist: The artist of the album, used for log messages.
+    :return: A dictionary with the keys "easy", "medium", and "hard", or None if the response is invalid.
+    """
+    logger.debug("OpenAI's response for '%s' by %s:\n%s", album, artist, raw_content)
+
+    trivia_json = extract_json_from_response(raw_content)
+
+    if not validate_trivia_questions(trivia_json):
+        logger.warning(f"Invalid or incomplete JSON data for '{album}' by {artist}.")
+        return None
+    return {difficulty: trivia_json[difficulty] for difficulty in ("easy", "medium", "hard")}
+
+def get_retry_after(error):
+    """
+    Returns the seconds to wait given in the Retry-After header of a rate limit error.
+
+    :param error: The RateLimitError raised by the OpenAI client.
+    :return: The number of seconds, or None if the response has no valid Retry-After header.
+    """
+    try:
+        return float(error.response.headers["retry-after"])
+    except (AttributeError, KeyError, ValueError):
+        return None
+
+async def request_album_trivia(prompt, album, artist, retries=3):
+    """
+    Requests all trivia questions of an album from OpenAI in a single call.
+
+    :param prompt: The prompt describing the questions to generate.
+    :param album: The title of the album, used for log messages.
+    :param artist: The artist of the album, used for log messages.
+    :param retries: The number of times to retry calling the OpenAI API in case of errors.
+    :return: A dictionary with the keys "easy", "medium", and "hard", or None if all attempts failed.
+    """
+    status_tracker.num_tasks_started += 1
+    prompt_tokens = count_prompt_tokens(prompt)
+    request = build_chat_request(prompt, prompt_tokens)
+
+    async with api_semaphore:
+        for attempt in range(retries):
+            retry_after = None
+            # Every attempt, including retries and re-sends of cut off responses, waits for the
+            # rate limits and the pause after a rate limit error. Until the first responses
+            # arrive, the request is estimated with its full token budget.
+            reservation = await status_tracker.wait_for_capacity(prompt_tokens + request["max_tokens"])
+            try:
+                response = await client.chat.completions.create(**request)
+                status_tracker.record_usage(reservation, response.usage.total_tokens)
+
+                if response.choices[0].finish_reason == "length":
+                    # The JSON is incomplete
+                    if attempt < retries - 1:
+                        # Retry at once with more room for the answer
+                        request["max_tokens"] = min(2 * request["max_tokens"], MODEL_CONTEXT_TOKENS - prompt_tokens)
+                        logger.warning(f"Response for '{album}' by {artist} was cut off, "
+                                       f"retrying with max_tokens={request['max_tokens']}.")
+                        continue
+                    logger.warning(f"Response for '{album}' by {artist} was cut off "
+                                   f"at max_tokens={request['max_tokens']}.")
+                else:
+                    raw_content = response.choices[0].message.content.strip()
+                    questions = parse_trivia_response(raw_content, album, artist)
+
+                    if questions is not None:
+                        status_tracker.num_tasks_succeeded += 1
+                        return questions
+
+            except (RateLimitError, APIError) as e:
+                if isinstance(e, RateLimitError):
+                    status_tracker.record_rate_limit_error()
+                    retry_after = get_retry_after(e)
+                else:
+                    status_tracker.num_api_errors += 1
+                if isinstance(e, APIStatusError) and e.status_code in NON_RETRYABLE_STATUS_CODES:
+                    logger.error(f"OpenAI rejected the request for '{album}' by {artist}: {e}")
+                    break
+                logger.warning(f"Error calling OpenAI (attempt {attempt + 1} of {retries}): {e}")
+            except Exception as e:
+                status_tracker.num_other_errors += 1
+                logger.warning(f"Error processing OpenAI response (attempt {attempt + 1} of {retries}): {e}")
+
+            if attempt < retries - 1:
+                if retry_after is not None:
+                    # OpenAI says when the limit allows the next request
+                    await asyncio.sleep(min(60, retry_after))
+                else:
+                    # Exponential backoff with jitter so that concurrent requests do not retry in lockstep
+                    await asyncio.sleep(min(60, 2 ** attempt) + random.random())
+            else:
+                logger.error(f"Giving up after {retries} attempts.")
+
+    status_tracker.num_tasks_failed += 1
+    return None
+
+# Question categories; a tuple, so concurrent prompt builds cannot modify it
+CATEGORIES = (
+    "Erfolge und Chartplatzierungen",
+    "Songtexte und Bedeutung",
+    "Musikalische Elemente",
+    "Produktion und Kollaborationen",
+    "Hintergrund und interessante Fakten",
+    "Historische und kulturelle Bedeutung",
+    "Inspirationsquellen des Künstlers",
+    "Live-Auftritte und Touren",
+    "Kritiken und Rezeption",
+    "Musikvideos und visuelle Inhalte",
+    "Fan-Reaktionen und Popkultur-Einflüsse",
+    "Albumkonzept und Thematik",
+    "Instrumentierung und Produktionstechniken",
+    "Bedeutende Auftritte",
+    "Reaktionen der Musikpresse",
+    "Einfluss auf die Musikszene",
+    "Erfolge bei Musikpreisen",
+    "Persönliche Erfahrungen des Künstlers",
+    "Soziale und politische Relevanz",
+    "Stilistische Innovationen",
+    "Gesellschaftliche Botschaften",
+    "Berühmte Zitate aus dem Album",
+    "Aufnahmeprozess",
+    "Kontroversen um das Album",
+    "Veröffentlichung und Vermarktung",
+    "Internationale Bedeutung",
+    "Verlorene Tracks oder unveröffentlichte Musik",
+    "Bedeutung der Albumkunst",
+    "Albumtitel und seine Bedeutung",
+    "Remixes und alternative Versionen",
+    "Reaktionen von Kritikern und Fans im Laufe der Zeit",
+    "Einfluss auf andere Künstler",
+    "Live-Performances bestimmter Songs",
+    "Verwendete Aufnahmetechniken",
+    "Bedeutung der Track-Reihenfolge",
+    "Zusammenarbeit mit Produzenten",
+    "Rekordverkäufe und Meilensteine",
+    "Neuinterpretationen oder Coverversionen",
+    "Einfluss auf die Mode und Kultur",
+    "Nachhaltigkeit und Umweltbewusstsein des Albums",
+    "Relevanz in Filmen und TV-Shows",
+    "Geheime Botschaften oder versteckte Hinweise in Songs",
+    "Einflüsse aus anderen Musikgenres",
+    "Persönliche Geschichten der Bandmitglieder",
+    "Langfristiger Einfluss auf das Musikgeschäft",
+    "Trivia zur ersten Performance bestimmter Songs",
+    "Verwendung des Albums in der Werbung",
+    "Einfluss auf soziale Bewegungen",
+    "Entstehungsgeschichte des Albums",
+    "Einfluss auf nachfolgende Musikgenerationen",
+    "Produktionstechnische Herausforderungen",
+    "Wirtschaftlicher Erfolg und Vermarktung",
+    "Gesellschaftlicher Kontext",
+    "Entwicklung des Musikstils des Künstlers",
+    "Zusätzliche Inhalte und Deluxe-Versionen",
+    "Besondere musikalische Arrangements",
+    "Reaktionen von Zeitgenossen",
+    "Visuelle Elemente und Bühnenshow",
+    "Samplings und Referenzen",
+    "Technologische Innovationen",
+    "Thematische Kontinuität mit früheren Werken",
+    "Posthume Bedeutung des Albums",
+    "Fandom und Merchandise",
+    "Crossover-Erfolg",
+    "Aufnahmelocation",
+    "Soundtrack-Verwendung",
+    "Hörgewohnheiten und Musikkonsum",
+    "Wissenschaftliche oder akademische Rezeption",
+    "Konzept und Storytelling im Album",
+    "Einfluss von Literatur oder Kunst auf das Album",
+    "Verwendung in Sportereignissen oder politischen Kampagnen",
+    "Kritische Reaktionen auf bestimmte Songs",
+    "Ungewöhnliche Kollaborationen oder Gastauftritte",
+    "Symbolik in Texten und Artwork",
+    "Änderungen in der Bandbesetzung",
+    "Finanzielle Kosten der Produktion",
+    "Musikalische Rückbesinnung oder Revival",
+)
+
+def build_album_prompt(album, artist, year):
+    """
+    Builds the prompt requesting all trivia questions of an album.
     The questions are categorized into easy, medium, and hard difficulties.
 
+    :param album: The title of the album.
+    :param artist: The artist of the album.
+    :param year: The release year of the album.
+    :return: The prompt for the album.
+    """
+    # Pick 9 distinct categories up front and give 3 to each difficulty, one for each question,
+    # so no topic is asked twice for the same album
+    selected = random.sample(CATEGORIES, 9)
+    categories_by_difficulty = {
+        difficulty: selected[index * 3:index * 3 + 3]
+        for index, difficulty in enumerate(("easy", "medium", "hard"))
+    }
+    category_list = "\n".join(
+        f"            - {difficulty}: " + "; ".join(f"'{category}'" for category in categories)
+        for difficulty, categories in categories_by_difficulty.items()
+    )
+
+    # The instructions are the same for every album and come first, followed by the album
+    # details. OpenAI caches the processing of repeated prompt prefixes, so the shared part
+    # is only charged and computed once while it stays cached.
+    return f"""
+            Erstelle 9 Trivia-Fragen auf Deutsch für das unten angegebene Album.
+            Erstelle 3 Fragen pro Schwierigkeitsgrad. Jede Frage sollte sich auf eine der unten angegebenen Kategorien ihres Schwierigkeitsgrads konzentrieren.
+            Die Fragen sollten variabel formuliert sein. Verwende unterschiedliche Satzstrukturen und eine abwechslungsreiche Sprache in jeder Frage.
+            Jede Frage MUSS den Namen des Künstlers und den Titel des Albums explizit in der Frage und der Trivia enthalten.
+            Die Optionen sollten KEINE Buchstaben (A, B, C...) oder Nummerierungen enthalten.
+            Die richtige Antwort muss in der Trivia ausdrücklich erwähnt und erklärt werden. Die Trivia sollte spezifisch auf die richtige Antwort eingehen und detaillierte Informationen dazu geben.
+            Die Trivia sollte 3 bis 4 Sätze lang sein und detaillierte Informationen über den Künstler, das Album oder die Songs liefern.
+            Die Fragen sollten als JSON-Objekt mit den Schlüsseln 'easy', 'medium' und 'hard' zurückgegeben werden.
+            Jeder Schlüssel enthält eine Liste mit genau 3 Fragen mit 'question', 'options', 'correctAnswer' und 'trivia'.
+
+            Album: '{album}' von {artist}, veröffentlicht im Jahr {year}
+            Kategorien pro Schwierigkeitsgrad:
+{category_list}
+            """
+
+def get_cache_key(album, artist, year):
+    """
+    Builds the response cache key of an album from everything that determines its questions.
+    """
+    key = f"{artist}|{album}|{year}|{OPENAI_MODEL}|{PROMPT_VERSION}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def load_cached_trivia(album, artist, year):
+    """
+    Loads the questions of an album from the response cache.
+
+    :param album: The title of the album.
+    :param artist: The artist of the album.
+    :param year: The release year of the album.
+    :return: The cached questions, or None if the album is not cached.
+    """
+    with RESPONSE_CACHE_LOCK, shelve.open(RESPONSE_CACHE_FILE) as cache:
+        return cache.get(get_cache_key(album, artist, year))
+
+def store_cached_trivia(album, artist, year, questions):
+    """
+    Stores the complete questions of an album in the response cache.
+    Incomplete results are not cached. The album is still written to the JSON file with its
+    incomplete questions, so later runs skip it until its entry is removed from the file.
+    """
+    if not all(questions.values()):
+        return
+    with RESPONSE_CACHE_LOCK, shelve.open(RESPONSE_CACHE_FILE) as cache:
+        cache[get_cache_key(album, artist, year)] = questions
+
+async def generate_trivia_for_album(album, artist, year, retries=3):
+    """
+    Generates trivia questions for an album with the given artist, album title, and year.
+    All 9 questions (3 per difficulty level) are requested in a single API call.
+
     :param album: The title of the album.
     :param artist: The artist of the album.
     :param year: The release year of the album.
@@ -106,152 +715,156 @@ def generate_trivia_for_album(album, artist, year, retries=3):
     """
 
     # Initialize the result dictionary
+    cached_questions = await asyncio.to_thread(load_cached_trivia, album, artist, year)
+    if cached_questions is not None:
+        logger.info(f"Using cached trivia for '{album}' by {artist}.")
+        return cached_questions
+
     questions = {"easy": [], "medium": [], "hard": []}
 
-    # Expanded categories list
-    categories = [
-        "Erfolge und Chartplatzierungen",
-        "Songtexte und Bedeutung",
-        "Musikalische Elemente",
-        "Produktion und Kollaborationen",
-        "Hintergrund und interessante Fakten",
-        "Historische und kulturelle Bedeutung",
-        "Inspirationsquellen des Künstlers",
-        "Live-Auftritte und Touren",
-        "Kritiken und Rezeption",
-        "Musikvideos und visuelle Inhalte",
-        "Fan-Reaktionen und Popkultur-Einflüsse",
-        "Albumkonzept und Thematik",
-        "Instrumentierung und Produktionstechniken",
-        "Bedeutende Auftritte",
-        "Reaktionen der Musikpresse",
-        "Einfluss auf die Musikszene",
-        "Kollaborationen mit anderen Künstlern",
-        "Erfolge bei Musikpreisen",
-        "Persönliche Erfahrungen des Künstlers",
-        "Soziale und politische Relevanz",
-        "Musikvideos und visuelle Elemente",
-        "Stilistische Innovationen",
-        "Gesellschaftliche Botschaften",
-        "Berühmte Zitate aus dem Album",
-        "Aufnahmeprozess",
-        "Kontroversen um das Album",
-        "Künstlerische Inspirationen",
-        "Veröffentlichung und Vermarktung",
-        "Internationale Bedeutung",
-        "Verlorene Tracks oder unveröffentlichte Musik",
-        "Bedeutung der Albumkunst",
-        "Albumtitel und seine Bedeutung",
-        "Remixes und alternative Versionen",
-        "Reaktionen von Kritikern und Fans im Laufe der Zeit",
-        "Einfluss auf andere Künstler",
-        "Live-Performances bestimmter Songs",
-        "Verwendete Aufnahmetechniken",
-        "Bedeutung der Track-Reihenfolge",
-        "Visuelle Elemente bei Tourneen",
-        "Zusammenarbeit mit Produzenten",
-        "Rekordverkäufe und Meilensteine",
-        "Soziale und politische Themen im Album",
-        "Neuinterpretationen oder Coverversionen",
-        "Einfluss auf die Mode und Kultur",
-        "Nachhaltigkeit und Umweltbewusstsein des Albums",
-        "Relevanz in Filmen und TV-Shows",
-        "Geheime Botschaften oder versteckte Hinweise in Songs",
-        "Einflüsse aus anderen Musikgenres",
-        "Persönliche Geschichten der Bandmitglieder",
-        "Langfristiger Einfluss auf das Musikgeschäft",
-        "Trivia zur ersten Performance bestimmter Songs",
-        "Verwendung des Albums in der Werbung",
-        "Einfluss auf soziale Bewegungen",
-        "Entstehungsgeschichte des Albums",
-        "Einfluss auf nachfolgende Musikgenerationen",
-        "Produktionstechnische Herausforderungen",
-        "Wirtschaftlicher Erfolg und Vermarktung",
-        "Gesellschaftlicher Kontext",
-        "Entwicklung des Musikstils des Künstlers",
-        "Zusätzliche Inhalte und Deluxe-Versionen",
-        "Besondere musikalische Arrangements",
-        "Reaktionen von Zeitgenossen",
-        "Visuelle Elemente und Bühnenshow",
-        "Samplings und Referenzen",
-        "Technologische Innovationen",
-        "Thematische Kontinuität mit früheren Werken",
-        "Posthume Bedeutung des Albums",
-        "Fandom und Merchandise",
-        "Crossover-Erfolg",
-        "Aufnahmelocation",
-        "Soundtrack-Verwendung",
-        "Hörgewohnheiten und Musikkonsum",
-        "Wissenschaftliche oder akademische Rezeption",
-        "Konzept und Storytelling im Album",
-        "Einfluss von Literatur oder Kunst auf das Album",
-        "Verwendung in Sportereignissen oder politischen Kampagnen",
-        "Kritische Reaktionen auf bestimmte Songs",
-        "Ungewöhnliche Kollaborationen oder Gastauftritte",
-        "Symbolik in Texten und Artwork",
-        "Änderungen in der Bandbesetzung",
-        "Finanzielle Kosten der Produktion",
-        "Relevanz für bestimmte soziale Bewegungen",
-        "Musikalische Rückbesinnung oder Revival",
-    ]
-
-    # Loop over difficulty levels
-    for difficulty in ["easy", "medium", "hard"]:
-        used_categories = set()
-
-        while len(questions[difficulty]) < 3:
-            # Shuffle categories for each question generation to ensure randomness
-            random.shuffle(categories)
-            available_categories = [cat for cat in categories if cat not in used_categories]
-            if not available_categories:
-                print(f"No more available categories for {difficulty}.")
-                break
-            selected_category = available_categories.pop()
-            used_categories.add(selected_category)
-
-            prompt = f"""
-            Erstelle 1 Trivia-Frage auf Deutsch für das Album '{album}' von {artist}, das im Jahr {year} veröffentlicht wurde.
-            Die Frage sollte sich auf die Kategorie '{selected_category}' konzentrieren.
-            Die Frage sollte vom Schwierigkeitsgrad '{difficulty}' sein und variabel formuliert sein. Verwende unterschiedliche Satzstrukturen und eine abwechslungsreiche Sprache in jeder Frage.
-            Jede Frage MUSS den Namen des Künstlers {artist} und den Titel des Albums '{album}' explizit in der Frage und der Trivia enthalten.
-            Die Optionen sollten KEINE Buchstaben (A, B, C...) oder Nummerierungen enthalten.
-            Die richtige Antwort muss in der Trivia ausdrücklich erwähnt und erklärt werden. Die Trivia sollte spezifisch auf die richtige Antwort eingehen und detaillierte Informationen dazu geben.
-            Die Trivia sollte 3 bis 4 Sätze lang sein und detaillierte Informationen über den Künstler, das Album oder die Songs liefern.
-            Die Frage sollte im JSON-Format zurückgegeben werden mit 'question', 'options', 'correctAnswer' und 'trivia'.
-            """
+    prompt = build_album_prompt(album, artist, year)
 
-            for attempt in range(retries):
-                try:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": "You are a helpful trivia question generator."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=1200,
-                        temperature=0.7
-                    )
-
-                    raw_content = response['choices'][0]['message']['content'].strip()
-                    print(f"OpenAI's response for {difficulty}-questions from category '{selected_category}':\n{raw_content}")
-
-                    trivia_json = extract_json_from_response(raw_content)
-
-                    if trivia_json and isinstance(trivia_json, dict):
-                        questions[difficulty].append(trivia_json)
-                        break  # Successful attempt, move to the next question
-                    else:
-                        print(f"Invalid or empty JSON data for {difficulty}-questions from category '{selected_category}'.")
-
-                except Exception as e:
-                    print(f"Error calling OpenAI (attempt {attempt + 1} of {retries}): {e}")
-                    if attempt < retries - 1:
-                        time.sleep(5)
-                    else:
-                        print(f"Giving up after {retries} attempts.")
+    trivia_json = await request_album_trivia(prompt, album, artist, retries)
+    if trivia_json is not None:
+        questions.update(trivia_json)
+        await asyncio.to_thread(store_cached_trivia, album, artist, year, questions)
 
     return questions
 
+def write_batch_input(batch_input_file, prompts_by_id, output_tokens=MAX_OUTPUT_TOKENS):
+    """
+    Writes the JSONL input file of a Batch API job with one chat completion request per prompt.
+
+    :param batch_input_file: The path of the JSONL file to write.
+    :param prompts_by_id: A dictionary mapping the custom_id of every request to its prompt.
+    :param output_tokens: The output token budget of every request.
+    """
+    with open(batch_input_file, 'w', encoding='utf-8') as file:
+        for custom_id, prompt in prompts_by_id.items():
+            file.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_chat_request(prompt, output_tokens=output_tokens)
+            }, ensure_ascii=False) + "\n")
+
+async def run_batch_job(prompts_by_id, batch_input_file, poll_interval, output_tokens=MAX_OUTPUT_TOKENS):
+    """
+    Submits one job to the OpenAI Batch API and waits until it has ended.
+
+    :param prompts_by_id: A dictionary mapping the custom_id of every request to its prompt.
+    :param batch_input_file: The path of the JSONL file with the batch requests.
+    :param poll_interval: The number of seconds between two status checks.
+    :param output_tokens: The output token budget of every request.
+    :return: A dictionary mapping the custom_id of every successful request to the response content,
+             and the set of custom_ids whose responses were cut off at the token budget.
+    """
+    # Counting the tokens and writing the file run in a worker thread, off the event loop
+    await asyncio.to_thread(write_batch_input, batch_input_file, prompts_by_id, output_tokens)
+
+    with open(batch_input_file, 'rb') as file:
+        batch_file = await client.files.create(file=file, purpose="batch")
+    os.remove(batch_input_file)
+
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logger.info(f"Batch '{batch.id}' with {len(prompts_by_id)} albums submitted.")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+        logger.info(f"Batch '{batch.id}' status: {batch.status}")
+
+    contents = {}
+    truncated = set()
+    if not batch.output_file_id:
+        logger.error(f"Batch '{batch.id}' ended with status '{batch.status}' without results.")
+        return contents, truncated
+
+    output = await client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        result = parse_json(line)
+        response = result.get("response") or {}
+
+        if response.get("status_code") != 200:
+            logger.warning(f"Batch request '{result['custom_id']}' failed: {result.get('error')}")
+            continue
+
+        choice = response["body"]["choices"][0]
+        if choice.get("finish_reason") == "length":
+            # The JSON is incomplete, the request is submitted again with a larger budget
+            logger.warning(f"Batch request '{result['custom_id']}' was cut off at max_tokens={output_tokens}.")
+            truncated.add(result["custom_id"])
+            continue
+
+        contents[result["custom_id"]] = choice["message"]["content"].strip()
+
+    return contents, truncated
+
+async def generate_trivia_batch(albums, prompts, batch_input_file, poll_interval=60, retries=2):
+    """
+    Generates the trivia questions for several albums with the OpenAI Batch API.
+
+    All requests are written to a JSONL file, uploaded and processed as one batch job,
+    which costs half as much as regular requests and is not limited by the regular rate
+    limits. Results can take up to 24 hours, so the job status is polled until it ends.
+    Albums whose requests failed or returned invalid questions are submitted again in a
+    new job, up to the given number of attempts. If responses were cut off at the token
+    budget, the new job gets twice the budget, as regular requests do.
+
+    :param albums: A list of dictionaries with the keys "artist", "album", and "year".
+    :param prompts: The prompt for every album, in the order of albums.
+    :param batch_input_file: The path of the JSONL file with the batch requests.
+    :param poll_interval: The number of seconds between two status checks.
+    :param retries: The number of batch jobs submitted at most.
+    :return: A list with the questions of every album, in the order of albums.
+    """
+    all_questions = [{"easy": [], "medium": [], "hard": []} for _ in albums]
+    pending = list(range(len(albums)))
+    output_tokens = MAX_OUTPUT_TOKENS
+
+    for attempt in range(retries):
+        contents, truncated = await run_batch_job(
+            {f"album-{index}": prompts[index] for index in pending}, batch_input_file, poll_interval,
+            output_tokens
+        )
+        if truncated:
+            output_tokens = min(2 * output_tokens, MODEL_CONTEXT_TOKENS)
+
+        failed = []
+        for index in pending:
+            album_entry = albums[index]
+            raw_content = contents.get(f"album-{index}")
+            if raw_content is None:
+                failed.append(index)
+                continue
+
+            try:
+                questions = parse_trivia_response(raw_content, album_entry["album"], album_entry["artist"])
+            except ValueError as e:
+                logger.warning(f"Error processing batch response for '{album_entry['album']}' by {album_entry['artist']}: {e}")
+                questions = None
+
+            if questions is None:
+                failed.append(index)
+            else:
+                all_questions[index] = questions
+
+        pending = failed
+        if not pending:
+            break
+        if attempt < retries - 1:
+            logger.info(f"Resubmitting {len(pending)} failed albums in a new batch.")
+        else:
+            logger.error(f"No valid trivia for {len(pending)} albums after {retries} batch jobs.")
+
+    return all_questions
+
 def load_existing_json(json_file):
     """
     Loads the existing trivia data from the given JSON file.
@@ -259,38 +872,83 @@ def load_existing_json(json_file):
     If the file does not exist, an empty list is returned.
     If the file exists but is not a valid JSON file, an empty list is returned.
     """
-    if not os.path.exists(json_file):
+    try:
+        with open(json_file, 'rb') as file:
+            # Load the JSON data from the file
+            return parse_json(file.read())
+    except FileNotFoundError:
         # JSON file does not exist, return an empty list
         return []
+    except json.JSONDecodeError:
+        # JSON file is not valid, return an empty list
+        return []
 
-    with open(json_file, 'r') as file:
-        try:
-            # Load the JSON data from the file
-            return json.load(file)
-        except json.JSONDecodeError:
-            # JSON file is not valid, return an empty list
-            return []
+def get_album_key(artist, album):
+    """
+    Returns the key used to detect duplicate albums. Differences in upper and lower case
+    and surrounding whitespace, as they occur in merged genre lists, are ignored.
+    """
+    return artist.strip().casefold(), album.strip().casefold()
+
+def load_existing_keys(json_file):
+    """
+    Loads only the album keys (see get_album_key) of the existing trivia data in the given JSON file.
+
+    If ijson is installed the file is parsed as a stream, so only one entry is in memory
+    at a time. Otherwise the file is loaded completely.
+    If the file does not exist or is not a valid JSON file, an empty set is returned.
+    """
+    if ijson is None:
+        return {get_album_key(entry["artist"], entry["album"]) for entry in load_existing_json(json_file)}
+
+    keys = set()
+    try:
+        with open(json_file, 'rb') as file:
+            for entry in ijson.items(file, 'item'):
+                keys.add(get_album_key(entry["artist"], entry["album"]))
+    except FileNotFoundError:
+        return set()
+    except ijson.JSONError:
+        # JSON file is not valid, treat it like load_existing_json does
+        return set()
+    return keys
 
 def write_json_data(json_file: str, trivia_data: list) -> None:
     """
     Writes the given trivia data to the specified JSON file.
+    The data is written to a temporary file first, flushed to disk and then moved into
+    place, so an interrupted write or a crash never leaves a truncated JSON file behind.
 
     :param json_file: The path to the JSON file to write to.
     :param trivia_data: The list of trivia data to write to the file.
     """
-    with open(json_file, 'w') as file:
-        json.dump(trivia_data, file, indent=2, ensure_ascii=False)
-    print(f"JSON-Datei '{json_file}' wurde erfolgreich aktualisiert.")
+    tmp_file = f"{json_file}.tmp"
+    with open(tmp_file, 'wb') as file:
+        if orjson is not None:
+            file.write(orjson.dumps(trivia_data, option=orjson.OPT_INDENT_2))
+        else:
+            file.write(json.dumps(trivia_data, indent=2, ensure_ascii=False).encode('utf-8'))
+        # The data must be on disk before the rename, otherwise a crash can leave an empty file
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, json_file)
+    logger.info(f"JSON-Datei '{json_file}' wurde erfolgreich aktualisiert.")
 
-def create_json_format(album_data, genre, output_json_file):
+async def create_json_format(album_data, genre, output_json_file, use_batch=False, album_semaphore=None):
     """
     Creates the JSON format for the trivia data based on the given album data.
+    The trivia questions of the new albums are generated concurrently, limited by album_semaphore.
 
-    :param album_data: A list of dictionaries with the album data. Each dictionary should have the keys "artist", "album", and "year".
+    :param album_data: An iterable of dictionaries with the album data. Each dictionary should have the keys "artist", "album", and "year".
     :param genre: The genre of the album data. This is used as a key in the JSON data.
     :param output_json_file: The file to write the JSON data to.
+    :param use_batch: Whether to generate the trivia as one job with the OpenAI Batch API.
+    :param album_semaphore: Limits the albums processed at the same time, shared by all files
+                            of a run. Defaults to OAI_CONCURRENCY albums.
     """
-    trivia_data = load_existing_json(output_json_file)
+    new_entries = []
+    # Reading the output file blocks, keep it off the event loop so other files' albums continue
+    processed_keys = await asyncio.to_thread(load_existing_keys, output_json_file)
 
     for entry in album_data:
         artist = entry['artist']
@@ -298,66 +956,164 @@ def create_json_format(album_data, genre, output_json_file):
         year = entry['year']
 
         # Check if the album has already been processed
-        if (artist, album) in {(entry["artist"], entry["album"]) for entry in trivia_data}:
-            print(f"Album '{album}' von {artist} bereits verarbeitet, überspringe.")
+        album_key = get_album_key(artist, album)
+        if album_key in processed_keys:
+            logger.info(f"Album '{album}' von {artist} bereits verarbeitet, überspringe.")
             continue
+        processed_keys.add(album_key)
 
-        # Add the album to the trivia data
-        trivia_data.append({
+        new_entries.append({
             "artist": artist,
             "album": album,
-            "year": year,
-            # Generate the trivia questions for this album
-            "questions": generate_trivia_for_album(album, artist, year)
+            "year": year
         })
 
-        # Write the updated trivia data to the JSON file
-        write_json_data(output_json_file, trivia_data)
+    if not new_entries:
+        return
+
+    # The complete data is only needed when new albums are added
+    trivia_data = await asyncio.to_thread(load_existing_json, output_json_file)
+
+    # Generate the trivia questions for all new albums at once
+    if use_batch:
+        all_questions = [
+            await asyncio.to_thread(
+                load_cached_trivia, new_entry["album"], new_entry["artist"], new_entry["year"]
+            )
+            for new_entry in new_entries
+        ]
+        # Only the albums without cached questions are submitted
+        missing = [index for index, questions in enumerate(all_questions) if questions is None]
+        if missing:
+            batch_input_file = f"{os.path.splitext(output_json_file)[0]}_batchinput.jsonl"
+            batch_entries = [new_entries[index] for index in missing]
+            prompts = [
+                build_album_prompt(new_entry["album"], new_entry["artist"], new_entry["year"])
+                for new_entry in batch_entries
+            ]
+            batch_questions = await generate_trivia_batch(batch_entries, prompts, batch_input_file)
+            for index, new_entry, questions in zip(missing, batch_entries, batch_questions):
+                all_questions[index] = questions
+                await asyncio.to_thread(
+                    store_cached_trivia, new_entry["album"], new_entry["artist"], new_entry["year"], questions
+                )
+        for new_entry, questions in zip(new_entries, all_questions):
+            new_entry["questions"] = questions
+            trivia_data.append(new_entry)
+    else:
+        if album_semaphore is None:
+            album_semaphore = asyncio.Semaphore(OAI_CONCURRENCY)
+
+        async def generate_entry_trivia(new_entry):
+            async with album_semaphore:
+                new_entry["questions"] = await generate_trivia_for_album(
+                    new_entry["album"], new_entry["artist"], new_entry["year"]
+                )
 
-def process_files_in_directory(input_dir, output_json_dir, finished_dir):
+        tasks = [asyncio.create_task(generate_entry_trivia(new_entry)) for new_entry in new_entries]
+
+        # Checkpoints count albums as they finish, so a slow album does not hold back the
+        # others. The checkpoint contains the finished albums, still in input order.
+        for finished, task in enumerate(asyncio.as_completed(tasks), start=1):
+            await task
+            if finished % CHECKPOINT_INTERVAL == 0 and finished < len(new_entries):
+                finished_entries = [new_entry for new_entry in new_entries if "questions" in new_entry]
+                await asyncio.to_thread(write_json_data, output_json_file, trivia_data + finished_entries)
+
+        trivia_data.extend(new_entries)
+
+    # Write the updated trivia data to the JSON file
+    # Written in a worker thread, so the requests of other files keep running meanwhile
+    await asyncio.to_thread(write_json_data, output_json_file, trivia_data)
+
+async def process_file(input_file_path, output_json_dir, finished_dir, use_batch, album_semaphore, output_locks):
     """
-    Processes all text files in the specified input directory:
+    Processes a single text file:
+    - Generates trivia for the albums in the file
+    - Writes the trivia to the JSON file of its genre
+    - Moves the file to the 'finished' directory
+
+    :param input_file_path: The path of the text file.
+    :param output_json_dir: Directory to store output JSON files.
+    :param finished_dir: Directory to move processed text files to.
+    :param use_batch: Whether to generate the trivia with the OpenAI Batch API.
+    :param album_semaphore: Limits the albums processed at the same time across all files.
+    :param output_locks: One lock per output JSON file, so that files of the same genre
+                         do not write the same JSON file at the same time.
+    """
+    filename = os.path.basename(input_file_path)
+
+    # Extract the genre name by removing specific prefixes and suffixes
+    genre_name = GENRE_AFFIX_PATTERN.sub('', os.path.splitext(filename)[0])
+
+    # Define the path for the output JSON file based on the genre name
+    output_json_file = os.path.join(output_json_dir, f"{genre_name}.json")
+
+    async with output_locks[output_json_file]:
+        logger.info(f"Processing file: {filename}")
+
+        # Read album data from the text file in a worker thread
+        album_data = await asyncio.to_thread(list, read_album_data(input_file_path))
+
+        # Generate trivia and save it to a JSON file
+        await create_json_format(album_data, genre_name, output_json_file, use_batch, album_semaphore)
+
+    # Move the processed file to the 'finished' directory
+    try:
+        await asyncio.to_thread(shutil.move, input_file_path, os.path.join(finished_dir, filename))
+    except FileNotFoundError:
+        # The file was removed during processing
+        logger.warning(f"File '{filename}' no longer exists and could not be moved.")
+    else:
+        logger.info(f"File '{filename}' has been moved to the 'finished' directory.")
+
+async def process_files_in_directory(input_dir, output_json_dir, finished_dir, use_batch=False,
+                                     parallel_albums=OAI_CONCURRENCY):
+    """
+    Processes all text files in the specified input directory concurrently:
     - Generates trivia for each file
     - Writes the trivia to a corresponding JSON file
     - Moves the processed files to a 'finished' directory
 
     The output JSON filename is derived from the text file by stripping the
-    "top100_" prefix and "_albums" suffix.
+    "top100_" prefix and "_albums" suffix. The OpenAI requests of all files share the
+    global concurrency and tokens-per-minute limits.
 
     :param input_dir: Directory containing input text files.
     :param output_json_dir: Directory to store output JSON files.
     :param finished_dir: Directory to move processed text files to.
+    :param use_batch: Whether to generate the trivia with the OpenAI Batch API.
+    :param parallel_albums: The maximum number of albums processed at the same time across all files.
     """
     # Create output and finished directories if they do not exist
-    if not os.path.exists(output_json_dir):
-        os.makedirs(output_json_dir)
-    if not os.path.exists(finished_dir):
-        os.makedirs(finished_dir)
-
-    # Sort filenames alphabetically in the input directory
-    for filename in sorted(os.listdir(input_dir)):
-        if filename.endswith(".txt"):
-            input_file_path = os.path.join(input_dir, filename)
-
-            # Extract the genre name by removing specific prefixes and suffixes
-            genre_name = re.sub(r'^top100_|_albums$', '', os.path.splitext(filename)[0])
+    os.makedirs(output_json_dir, exist_ok=True)
+    os.makedirs(finished_dir, exist_ok=True)
 
-            # Define the path for the output JSON file based on the genre name
-            output_json_file = os.path.join(output_json_dir, f"{genre_name}.json")
+    output_locks = defaultdict(asyncio.Lock)
+    # One semaphore for all files, so --parallel-albums limits the albums of the whole run
+    album_semaphore = asyncio.Semaphore(parallel_albums)
 
-            print(f"Processing file: {filename}")
+    # Start the files in alphabetical order
+    await asyncio.gather(*[
+        process_file(entry.path, output_json_dir, finished_dir, use_batch, album_semaphore, output_locks)
+        for entry in sorted(os.scandir(input_dir), key=lambda entry: entry.name)
+        if entry.is_file() and entry.name.endswith(".txt")
+    ])
 
-            # Read album data from the text file
-            album_data = read_album_data(input_file_path)
-
-            # Generate trivia and save it to a JSON file
-            create_json_format(album_data, genre_name, output_json_file)
-
-            # Move the processed file to the 'finished' directory
-            shutil.move(input_file_path, os.path.join(finished_dir, filename))
-            print(f"File '{filename}' has been moved to the 'finished' directory.")
+def positive_int(value):
+    """
+    Converts a command line argument to an integer of at least 1.
+    Used as argparse type for the limits, where 0 would block every request.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' ist keine ganze Zahl")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"'{value}' muss mindestens 1 sein")
+    return number
 
-def main():
+async def main():
     """
     Main entry point for the script.
 
@@ -386,11 +1142,51 @@ def main():
         type=str,
         help="Pfad zum Verzeichnis, in das die abgearbeiteten Textdateien verschoben werden"
     )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help="Trivia über die OpenAI Batch API erzeugen (50%% günstiger, Ergebnisse innerhalb von 24 Stunden)"
+    )
+    parser.add_argument(
+        '--parallel-albums',
+        type=positive_int,
+        default=OAI_CONCURRENCY,
+        help="Maximale Anzahl der Alben, die gleichzeitig verarbeitet werden"
+    )
+    parser.add_argument(
+        '--rpm',
+        type=positive_int,
+        default=OAI_RPM_LIMIT,
+        help="Maximale Anzahl der OpenAI-Anfragen pro Minute"
+    )
+    parser.add_argument(
+        '--tpm',
+        type=positive_int,
+        default=OAI_TPM_LIMIT,
+        help="Maximale Anzahl der OpenAI-Tokens pro Minute"
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help="Detaillierte Ausgabe inklusive der vollständigen OpenAI-Antworten"
+    )
 
     args = parser.parse_args()
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Eingabeverzeichnis '{args.input_dir}' existiert nicht")
+    setup_logging(args.verbose)
+    status_tracker.rpm_limit = args.rpm
+    status_tracker.tpm_limit = args.tpm
 
     # Process the files in the given input directory
-    process_files_in_directory(args.input_dir, args.output_json_dir, args.finished_dir)
+    await process_files_in_directory(args.input_dir, args.output_json_dir, args.finished_dir, args.batch,
+                                     args.parallel_albums)
+
+    logger.info(f"OpenAI requests: {status_tracker.num_tasks_succeeded} of {status_tracker.num_tasks_started} succeeded, "
+                f"{status_tracker.num_tasks_failed} failed, {status_tracker.num_rate_limit_errors} rate limit errors.")
+
+    # Close the pooled connections before the event loop shuts down
+    await client.close()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())